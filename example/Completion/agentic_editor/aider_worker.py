@@ -0,0 +1,102 @@
+import io
+import os
+import sys
+import json
+import argparse
+import contextlib
+import traceback
+
+# Long-lived aider session used by the worker pool in main.py. Started once per project
+# directory, it keeps aider's model and repo map loaded and answers one request per line:
+#   stdin:  {"message": "...", "files": ["main.py", ...]}
+#   stdout: {"line": "..."} for every line aider prints while working, then
+#           {"error": "...", "returncode": 0} when the request is done
+# Anything aider prints outside a request goes to stderr so it cannot corrupt the protocol.
+
+# Aider's --chat-mode values that select a coder of their own; anything else is an edit
+# run using --edit-format, as with the command line
+CHAT_MODES = {"ask", "architect", "help", "context"}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Persistent aider session speaking JSON lines over stdin/stdout")
+    parser.add_argument("--chat-mode", default="code")
+    parser.add_argument("--edit-format", default="diff")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--input-history-file")
+    parser.add_argument("--chat-history-file")
+    return parser.parse_args()
+
+def send(protocol, payload):
+    protocol.write(json.dumps(payload) + "\n")
+    protocol.flush()
+
+class LineWriter(io.TextIOBase):
+    # Stand-in for sys.stdout during a request that forwards each completed line
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.pending = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        *lines, self.pending = (self.pending + text).split("\n")
+        for line in lines:
+            send(self.protocol, {"line": line})
+        return len(text)
+
+    def finish(self):
+        if self.pending:
+            send(self.protocol, {"line": self.pending})
+            self.pending = ""
+
+def main():
+    args = parse_args()
+    protocol = sys.stdout
+    sys.stdout = sys.stderr
+
+    try:
+        from aider.coders import Coder
+        from aider.io import InputOutput
+        from aider.models import Model
+
+        edit_format = args.chat_mode if args.chat_mode in CHAT_MODES else args.edit_format
+        coder = Coder.create(
+            main_model=Model(args.model),
+            edit_format=edit_format,
+            io=InputOutput(
+                yes=True,
+                pretty=False,
+                input_history_file=args.input_history_file,
+                chat_history_file=args.chat_history_file
+            ),
+            fnames=[],
+            use_git=False
+        )
+    except Exception:
+        send(protocol, {"ready": False, "error": traceback.format_exc()})
+        return 1
+    send(protocol, {"ready": True})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        output = LineWriter(protocol)
+        try:
+            request = json.loads(line)
+            # Every request starts a fresh conversation on the requested files, exactly
+            # like a one-shot `aider --message` run; only the loaded state is reused
+            coder.done_messages = []
+            coder.cur_messages = []
+            coder.abs_fnames = {os.path.abspath(name) for name in request.get("files", [])}
+            with contextlib.redirect_stdout(output):
+                coder.run(with_message=request["message"])
+            output.finish()
+            send(protocol, {"error": "", "returncode": 0})
+        except Exception:
+            output.finish()
+            send(protocol, {"error": traceback.format_exc(), "returncode": 1})
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+
+# Load test for the bookkeeping and listing endpoints of a running agentic_editor server.
+# It does not call aider; start the server as usual and point --url at it:
+#   uvicorn main:app --port 5000
+#   python load_test.py --url http://localhost:5000 --seed 2000 --concurrency 50
+
+READ_PATHS = ["/projects", "/users", "/cost-summary"]
+# Paths may contain {user}, replaced by a random seeded user id on every request
+SEED_USER = "load_user_{}"
+
+async def seed(count: int):
+    # Creates count projects spread over count // 10 users through the cost ledger, the
+    # same bookkeeping the aider endpoints use
+    import main
+
+    await main.init_db()
+    for i in range(count):
+        main.cost_ledger.record(f"load_{i}", SEED_USER.format(i % max(1, count // 10)), 0.0)
+    await main.cost_ledger.close()
+    await main.engine.dispose()
+    print(f"Seeded {count} projects")
+
+async def worker(client: httpx.AsyncClient, paths, users: int, deadline: float, latencies, errors):
+    while time.perf_counter() < deadline:
+        path = random.choice(paths).replace("{user}", SEED_USER.format(random.randrange(users)))
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 400:
+                errors.append(f"{path}: HTTP {response.status_code}")
+        except httpx.HTTPError as e:
+            errors.append(f"{path}: {e!r}")
+        latencies.append(time.perf_counter() - start)
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def run(args):
+    if args.seed:
+        await seed(args.seed)
+    latencies = []
+    errors = []
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, args.paths, args.users, deadline, latencies, errors) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies) or [float("nan")]
+    print(f"{'requests':>9} {'req/sec':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    print(f"{len(latencies):>9} {len(latencies) / elapsed:>9.1f} {percentile(ordered, 0.5) * 1000:>8.1f} "
+          f"{percentile(ordered, 0.95) * 1000:>8.1f} {percentile(ordered, 0.99) * 1000:>8.1f} {len(errors):>7}")
+    for error in sorted(set(errors))[:10]:
+        print(f"  {error}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent request load against the agentic_editor API.")
+    parser.add_argument("--url", default="http://localhost:5000", help="server to test (default: http://localhost:5000)")
+    parser.add_argument("--concurrency", type=int, default=20, help="simultaneous clients (default: 20)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run (default: 10)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="first create this many projects in the server's database (run from the server directory)")
+    parser.add_argument("--users", type=int, default=100, help="seeded users {user} is drawn from (default: 100)")
+    parser.add_argument("--path", dest="paths", action="append", help=f"endpoint to request, repeatable (default: {' '.join(READ_PATHS)})")
+    args = parser.parse_args(argv)
+    args.paths = args.paths or READ_PATHS
+    return args
+
+def main(argv=None):
+    asyncio.run(run(parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,1183 @@
 import os
-import fnmatch
+import re
+import sys
+import gzip
+import json
+import mmap
+import time
+import select
+import shutil
+import struct
+import hashlib
+import subprocess
+import threading
+import argparse
+import tempfile
+import ctypes
+import ctypes.util
+import tracemalloc
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-def read_gitignore(root_dir):
-    print("Reading .gitignore")
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ROOT_DIR = "/workspaces/sparc/fun"
+# Parallel reads only pay off when each read waits on the network (NFS, SMB, cloud volumes);
+# on a local disk they are slower than reading sequentially, so they are opt-in with -j
+DEFAULT_WORKERS = 1
+PARALLEL_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def parse_gitignore(gitignore_path):
+    patterns = []
+    with open(gitignore_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line and not line.startswith('#') and line.strip():
+                patterns.append(line)
+    return patterns
+
+def read_gitignore(root_dir, verbose=True):
+    if verbose:
+        log("Reading .gitignore")
     gitignore_path = os.path.join(root_dir, '.gitignore')
     ignored_patterns = []
     if os.path.exists(gitignore_path):
-        with open(gitignore_path, 'r') as f:
-            for line in f:
-                stripped_line = line.strip()
-                if stripped_line and not stripped_line.startswith('#'):
-                    if stripped_line.endswith('/'):
-                        ignored_patterns.append(f"{stripped_line}*")
-                    else:
-                        ignored_patterns.append(stripped_line)
-    print(f"Ignored patterns: {ignored_patterns}")
+        ignored_patterns = parse_gitignore(gitignore_path)
+    if verbose:
+        log(f"Ignored patterns: {ignored_patterns}")
     return ignored_patterns
 
-def get_folder_structure(root_dir):
-    print("Getting folder structure")
-    folder_structure = []
-    for root, dirs, files in os.walk(root_dir):
-        level = root.replace(root_dir, '').count(os.sep)
-        folder_structure.append((root, level))
-    return folder_structure
-
-def find_max_nesting(folder_structure):
-    print("Finding maximum nesting level")
-    max_nesting = max(level for _, level in folder_structure)
-    return max_nesting
-
-def should_ignore(file_path, ignored_patterns, script_name):
-    additional_ignored_files = ['README.md', 'create.sh']
-    if file_path == script_name or os.path.basename(file_path) in additional_ignored_files:
-        return True
-    for pattern in ignored_patterns:
-        if fnmatch.fnmatch(file_path, pattern) or fnmatch.fnmatch(os.path.basename(file_path), pattern):
-            return True
+def translate_glob_segment(segment):
+    # Translate one path segment of a gitignore glob; wildcards never match '/'
+    out = []
+    i, n = 0, len(segment)
+    while i < n:
+        c = segment[i]
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(segment[i]))
+        elif c == '[':
+            j = i + 1
+            if j < n and segment[j] in '!^':
+                j += 1
+            if j < n and segment[j] == ']':
+                j += 1
+            while j < n and segment[j] != ']':
+                j += 1
+            if j >= n:
+                out.append(re.escape(c))
+            else:
+                body = segment[i + 1:j]
+                negate = body[:1] in ('!', '^')
+                if negate:
+                    body = body[1:]
+                body = re.sub(r'([\\\[&~|])', r'\\\1', body)
+                out.append(f"[^/{body}]" if negate else f"[{body}]")
+                i = j
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+GLOB_CHARACTERS = set('*?[\\')
+
+def index_key(segments, anchored):
+    # A literal every path matched by the rule contains, used to find candidate rules:
+    # ('tail', n, literal) for the n-th segment from the end (0 is the basename),
+    # ('suffix', literal) or ('prefix', literal) for the basename, or ('head', n, literal)
+    # for the n-th segment of an anchored pattern. None means the rule has to be tried
+    # against every path. Only segments at a fixed distance from the end (after the last
+    # **) or from the start (before the first **) qualify.
+    stars = [index for index, segment in enumerate(segments) if segment == '**']
+    tail = segments[stars[-1] + 1:] if stars else segments
+    for offset, segment in enumerate(reversed(tail)):
+        if not GLOB_CHARACTERS.intersection(segment):
+            return 'tail', offset, segment
+    last = segments[-1]
+    if last.startswith('*') and last[1:] and not GLOB_CHARACTERS.intersection(last[1:]):
+        return 'suffix', last[1:]
+    if last.endswith('*') and last[:-1] and not GLOB_CHARACTERS.intersection(last[:-1]):
+        return 'prefix', last[:-1]
+    if anchored:
+        for offset, segment in enumerate(segments[:stars[0]] if stars else segments):
+            if not GLOB_CHARACTERS.intersection(segment):
+                return 'head', offset, segment
+    return None
+
+def translate_gitignore_pattern(pattern):
+    # Returns (regex, negated, dir_only, index_key) for one .gitignore line, or None if it
+    # has no rule. The regex is matched against paths relative to the directory holding
+    # the .gitignore.
+    stripped = pattern.rstrip(' ')
+    if stripped.endswith('\\') and len(stripped) < len(pattern):
+        stripped += ' '
+    pattern = stripped
+    if not pattern or pattern.startswith('#'):
+        return None
+    negated = pattern.startswith('!')
+    if negated:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    if not pattern:
+        return None
+    # A slash anywhere but at the end anchors the pattern to the .gitignore directory
+    anchored = '/' in pattern
+    if pattern.startswith('/'):
+        pattern = pattern[1:]
+    segments = pattern.split('/')
+    parts = []
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == '**':
+            parts.append('.+' if last and index else '.*' if last else '(?:[^/]*/)*')
+        else:
+            parts.append(translate_glob_segment(segment) + ('' if last else '/'))
+    regex = ''.join(parts)
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    return regex, negated, dir_only, index_key(segments, anchored)
+
+class IgnoreRules:
+    # The rules of one .gitignore, each compiled to an anchored regex and indexed by a
+    # literal part of the paths it can match (see index_key). A path only tries the few
+    # rules whose literal it contains, last rule first, so repos with hundreds of rules
+    # cost a handful of dict lookups per path rather than a regex per rule.
+    def __init__(self, patterns):
+        self.rules = []
+        self.unindexed = []
+        self.index = {}
+        for pattern in patterns:
+            rule = translate_gitignore_pattern(pattern)
+            if rule is None:
+                continue
+            regex, negated, dir_only, key = rule
+            number = len(self.rules)
+            self.rules.append((re.compile(regex), negated, dir_only))
+            if key is None:
+                self.unindexed.append(number)
+            else:
+                self.index.setdefault(key, []).append(number)
+        self.tail_offsets = sorted({key[1] for key in self.index if key[0] == 'tail'})
+        self.head_offsets = sorted({key[1] for key in self.index if key[0] == 'head'})
+        self.suffix_lengths = sorted({len(key[1]) for key in self.index if key[0] == 'suffix'})
+        self.prefix_lengths = sorted({len(key[1]) for key in self.index if key[0] == 'prefix'})
+
+    def match(self, relative_path, is_dir):
+        # True if ignored, False if re-included by a negated rule, None if no rule matches
+        segments = relative_path.split('/')
+        name = segments[-1]
+        keys = [('tail', offset, segments[-1 - offset]) for offset in self.tail_offsets if offset < len(segments)]
+        keys += [('head', offset, segments[offset]) for offset in self.head_offsets if offset < len(segments)]
+        keys += [('suffix', name[-length:]) for length in self.suffix_lengths if length <= len(name)]
+        keys += [('prefix', name[:length]) for length in self.prefix_lengths if length <= len(name)]
+        candidates = list(self.unindexed)
+        for key in keys:
+            candidates += self.index.get(key, ())
+        # Later rules override earlier ones
+        for number in sorted(candidates, reverse=True):
+            regex, negated, dir_only = self.rules[number]
+            if (is_dir or not dir_only) and regex.fullmatch(relative_path):
+                return not negated
+        return None
+
+def is_ignored(ignore_rules, relative_path, is_dir):
+    # ignore_rules is a tuple of (base_dir, IgnoreRules) from the root down; deeper
+    # .gitignore files take precedence over the ones above them.
+    if os.sep != '/':
+        relative_path = relative_path.replace(os.sep, '/')
+    for base_dir, rules in reversed(ignore_rules):
+        result = rules.match(relative_path[len(base_dir) + 1:] if base_dir else relative_path, is_dir)
+        if result is not None:
+            return result
     return False
 
-def list_files_with_contents(root_dir, script_name):
-    print("Listing files with contents")
-    ignored_patterns = read_gitignore(root_dir)
-    file_data = []
-    folder_structure = get_folder_structure(root_dir)
-    max_nesting = find_max_nesting(folder_structure)
-    file_data.append(f"Maximum level of nesting: {max_nesting}\n\nFolder Structure:\n")
-
-    # Add folder structure with indentation for levels
-    for folder, level in folder_structure:
-        indent = '    ' * level
-        folder_name = os.path.basename(folder) if os.path.basename(folder) else folder
-        file_data.append(f"{indent}- {folder_name}/")
-
-    file_data.append("\n\nFiles with Contents:\n")
-    for root, dirs, files in os.walk(root_dir):
-        # Exclude directories that match ignored patterns
-        dirs[:] = [d for d in dirs if not any(fnmatch.fnmatch(os.path.relpath(os.path.join(root, d), root_dir), pattern) for pattern in ignored_patterns)]
-        for file in files:
-            relative_path = os.path.relpath(os.path.join(root, file), root_dir)
-            if not should_ignore(relative_path, ignored_patterns, script_name):
+# Directories git never tracks, pruned even when .gitignore does not mention them.
+ALWAYS_IGNORED_DIRS = {'.git'}
+
+def is_ignored_dir(relative_path, ignore_rules):
+    if os.path.basename(relative_path) in ALWAYS_IGNORED_DIRS:
+        return True
+    return is_ignored(ignore_rules, relative_path, True)
+
+def scan_tree(root_dir, ignore_rules, script_name):
+    # Single os.scandir traversal in os.walk top-down order. Yields ('dir', path, level)
+    # for every directory descended into and ('file', relative_path, level) for every
+    # file that is not ignored. Ignored directories are pruned before descending, and
+    # scandir's cached d_type means no extra stat call per entry. Nested .gitignore
+    # files are compiled as they are reached and apply to everything below them.
+    stack = [(root_dir, '', 0, ignore_rules)]
+    while stack:
+        path, relative_dir, level, rules = stack.pop()
+        yield 'dir', path, level
+        subdirs = []
+        try:
+            with os.scandir(path) as iterator:
+                entries = list(iterator)
+        except OSError as e:
+            log(f"Error scanning directory {path}: {e}")
+            continue
+        if relative_dir and any(entry.name == '.gitignore' for entry in entries):
+            try:
+                nested_patterns = parse_gitignore(os.path.join(path, '.gitignore'))
+            except OSError as e:
+                log(f"Error reading {os.path.join(path, '.gitignore')}: {e}")
+                nested_patterns = []
+            if nested_patterns:
+                rules = rules + ((relative_dir.replace(os.sep, '/'), IgnoreRules(nested_patterns)),)
+        for entry in entries:
+            relative_path = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                # Like os.walk, symlinked directories are not followed
+                if not entry.is_symlink() and not is_ignored_dir(relative_path, rules):
+                    subdirs.append((entry.path, relative_path, level + 1, rules))
+            elif not should_ignore(relative_path, rules, script_name):
+                yield 'file', relative_path, level
+        stack.extend(reversed(subdirs))
+
+ADDITIONAL_IGNORED_FILES = {'README.md', 'create.sh'}
+
+def should_ignore(file_path, ignore_rules, script_name):
+    if file_path == script_name or os.path.basename(file_path) in ADDITIONAL_IGNORED_FILES:
+        return True
+    return is_ignored(ignore_rules, file_path, False)
+
+def run_git_ls_files(root_dir, *options):
+    # Returns the NUL-separated paths printed by git ls-files, or None when git is missing
+    # or root_dir is not inside a work tree
+    try:
+        result = subprocess.run(['git', '-C', root_dir, 'ls-files', '-z'] + list(options),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return [os.fsdecode(path) for path in result.stdout.split(b'\0') if path]
+
+def list_git_files(root_dir, include_untracked=False):
+    # Files tracked in the git index (relative to root_dir, in index order), optionally
+    # followed by untracked files that are not ignored. Submodules are left out; tracked
+    # files deleted from the work tree are listed and skipped when they are read, which
+    # saves git an lstat of every path. Returns None outside a git work tree.
+    staged = run_git_ls_files(root_dir, '--cached', '--stage')
+    if staged is None:
+        return None
+    paths = []
+    seen = set()
+    for line in staged:
+        # Each entry is "<mode> <object> <stage>\t<path>"; unmerged paths appear once per stage
+        info, path = line.split('\t', 1)
+        if info.startswith('160000') or path in seen:
+            continue
+        seen.add(path)
+        paths.append(path)
+    if include_untracked:
+        paths.extend(run_git_ls_files(root_dir, '--others', '--exclude-standard') or ())
+    return paths
+
+def scan_git_index(root_dir, relative_paths, script_name):
+    # Yields the same ('dir', path, level) and ('file', relative_path, level) entries as
+    # scan_tree, in the same top-down order, for a list of paths from the git index.
+    # Sorting by (directory components, name) puts each directory's files before its
+    # subdirectories. Directories without tracked files do not appear.
+    entries = sorted((tuple(directory.split('/')) if directory else (), name)
+                     for directory, _, name in (path.rpartition('/') for path in relative_paths))
+    yield 'dir', root_dir, 0
+    current = ()
+    relative_dir = ''
+    for directory, name in entries:
+        if directory != current:
+            common = 0
+            while common < min(len(current), len(directory)) and current[common] == directory[common]:
+                common += 1
+            for depth in range(common, len(directory)):
+                yield 'dir', os.path.join(root_dir, *directory[:depth + 1]), depth + 1
+            current = directory
+            relative_dir = os.sep.join(directory)
+        relative_path = relative_dir + os.sep + name if relative_dir else name
+        if name not in ADDITIONAL_IGNORED_FILES and relative_path != script_name:
+            yield 'file', relative_path, len(directory)
+
+def skip_excluded(entries, root_dir, excluded):
+    # Drops the entries at or under the paths in excluded, e.g. the snapshot's own output
+    # when it is written inside the tree. Paths outside root_dir cost nothing.
+    root = os.path.abspath(root_dir)
+    inside = []
+    for path in excluded:
+        relative_path = os.path.relpath(os.path.abspath(path), root)
+        if relative_path not in (os.curdir, os.pardir) and not relative_path.startswith(os.pardir + os.sep):
+            inside.append(relative_path)
+    if not inside:
+        return entries
+    prefixes = tuple(relative_path + os.sep for relative_path in inside)
+
+    def kept(entries):
+        for kind, path, level in entries:
+            relative_path = os.path.relpath(path, root_dir) if kind == 'dir' else path
+            if relative_path not in inside and not relative_path.startswith(prefixes):
+                yield kind, path, level
+    return kept(entries)
+
+def iter_tree_entries(root_dir, script_name, enumeration='walk', include_untracked=False, verbose=True,
+                      excluded=()):
+    # The scan_tree entries for root_dir. enumeration is 'walk' to scan the file system,
+    # 'git' to list files from the git index, or 'auto' to use the index when root_dir
+    # is in a git work tree and git lists files under it; an untracked or ignored root
+    # lists nothing, and is scanned instead. Files and directories in excluded are left out.
+    git_paths = None
+    if enumeration != 'walk':
+        git_paths = list_git_files(root_dir, include_untracked)
+        if git_paths is None:
+            if enumeration == 'git':
+                raise RuntimeError(f"{root_dir} is not inside a git work tree")
+            if verbose:
+                log("Not a git work tree, scanning the file system")
+        elif not git_paths and enumeration == 'auto':
+            git_paths = None
+            if verbose:
+                log("No files under the root are tracked by git, scanning the file system")
+    if git_paths is not None:
+        if verbose:
+            log(f"Listing {len(git_paths)} files from the git index")
+        return skip_excluded(scan_git_index(root_dir, git_paths, script_name), root_dir, excluded)
+    ignore_rules = (('', IgnoreRules(read_gitignore(root_dir, verbose))),)
+    if verbose:
+        log("Scanning folder structure")
+    return skip_excluded(scan_tree(root_dir, ignore_rules, script_name), root_dir, excluded)
+
+class FileRecord(namedtuple('FileRecord', ['relative_path', 'content', 'error', 'elapsed', 'status', 'note'],
+                            defaults=(None,))):
+    # One file of the snapshot. status is 'read' without a cache; with one it is
+    # 'cached', 'added', 'modified' or 'unchanged' (re-read, same hash). Files that fail
+    # to read are 'error' and files left out by the size or binary checks are 'skipped'.
+    # note says why a file was skipped or truncated.
+    __slots__ = ()
+
+    def framed(self):
+        if self.error is not None:
+            return f"### {self.relative_path} ###\nError reading file: {self.error}\n\n"
+        return f"### {self.relative_path} ###\n{self.content}\n\n"
+
+def unframe(relative_path, text):
+    # Inverse of FileRecord.framed for consumers that store content without the header
+    return text[len(f"### {relative_path} ###\n"):-2]
+
+# Like git, a NUL byte in the first 8000 bytes marks a file as binary
+SNIFF_BYTES = 8000
+DEFAULT_MAX_FILE_SIZE = 10 * 2**20
+
+def read_text(full_path, max_file_size=DEFAULT_MAX_FILE_SIZE, truncate_at=0):
+    # Returns (content, note); content is None when the file is skipped. Sizes of 0 disable
+    # the corresponding limit. Decoding and newline handling match open(..., 'r',
+    # encoding='utf-8', errors='ignore').
+    with open(full_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if max_file_size and size > max_file_size:
+            return None, f"too large: {size} bytes"
+        data = f.read(SNIFF_BYTES)
+        if b'\0' in data:
+            return None, "binary"
+        note = None
+        if truncate_at and size > truncate_at:
+            data = data[:truncate_at] + f.read(max(0, truncate_at - len(data)))
+            note = f"truncated: first {truncate_at} of {size} bytes"
+        else:
+            data += f.read()
+    content = data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+    if note is not None:
+        content += f"\n[... {note} ...]"
+    return content, note
+
+def read_file_contents(root_dir, relative_path, cache=None, max_file_size=DEFAULT_MAX_FILE_SIZE, truncate_at=0):
+    start = time.perf_counter()
+    try:
+        full_path = os.path.join(root_dir, relative_path)
+        if cache is not None:
+            stat = os.stat(full_path)
+            cached = cache.load(relative_path, stat)
+            if cached is not None:
+                return FileRecord(relative_path, cached[0], None, time.perf_counter() - start, 'cached', cached[1])
+        content, note = read_text(full_path, max_file_size, truncate_at)
+        if content is None:
+            return FileRecord(relative_path, None, None, time.perf_counter() - start, 'skipped', note)
+        status = cache.store(relative_path, stat, content, note) if cache is not None else 'read'
+        return FileRecord(relative_path, content, None, time.perf_counter() - start, status, note)
+    except FileNotFoundError:
+        return FileRecord(relative_path, None, None, time.perf_counter() - start, 'skipped', "missing")
+    except Exception as e:
+        return FileRecord(relative_path, None, e, time.perf_counter() - start, 'error')
+
+def read_files_in_order(root_dir, relative_paths, workers=1, cache=None, max_file_size=DEFAULT_MAX_FILE_SIZE,
+                        truncate_at=0):
+    # Yields a FileRecord per path in input order. With more than one worker reads
+    # run on a thread pool, with at most 2 * workers in flight.
+    if workers <= 1:
+        for relative_path in relative_paths:
+            yield read_file_contents(root_dir, relative_path, cache, max_file_size, truncate_at)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for relative_path in relative_paths:
+            pending.append(executor.submit(read_file_contents, root_dir, relative_path, cache,
+                                           max_file_size, truncate_at))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+class SnapshotCache:
+    # Persistent manifest of path -> size, mtime_ns and sha256 of the content, backed by a
+    # content-addressed object store. Files whose size and mtime match the manifest are
+    # spliced in from the store instead of being read from the tree again.
+    def __init__(self, cache_dir, options=None):
+        # options records settings that change stored content (size limits); a manifest
+        # written with different options is discarded
+        self.cache_dir = cache_dir
+        self.options = options or {}
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.previous = {}
+        self.previous_ns = 0
+        self.current = {}
+        self.started_ns = time.time_ns()
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get('options', {}) == self.options:
+                    self.previous = manifest['files']
+                    self.previous_ns = manifest['generated_ns']
+                else:
+                    log("Snapshot options changed since the last run, re-reading all files")
+            except (OSError, ValueError, KeyError) as e:
+                log(f"Ignoring unreadable manifest {self.manifest_path}: {e}")
+
+    def object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash[:2], content_hash[2:])
+
+    def load(self, relative_path, stat):
+        entry = self.previous.get(relative_path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return None
+        # A file written during the previous run may have changed again within the
+        # same mtime tick, so only trust entries older than that run
+        if stat.st_mtime_ns >= self.previous_ns:
+            return None
+        try:
+            with open(self.object_path(entry['hash']), 'r', encoding='utf-8', newline='') as f:
+                content = f.read()
+        except OSError:
+            return None
+        self.current[relative_path] = entry
+        return content, entry.get('note')
+
+    def store(self, relative_path, stat, content, note=None):
+        data = content.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        object_path = self.object_path(content_hash)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            temp_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, object_path)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': content_hash}
+        if note is not None:
+            entry['note'] = note
+        self.current[relative_path] = entry
+        previous = self.previous.get(relative_path)
+        if previous is None:
+            return 'added'
+        return 'unchanged' if previous['hash'] == content_hash else 'modified'
+
+    def removed(self, seen_paths):
+        return [path for path in self.previous if path not in seen_paths]
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'generated_ns': self.started_ns, 'options': self.options, 'files': self.current}, f)
+        os.replace(temp_path, self.manifest_path)
+        # Drop objects no entry refers to any more
+        referenced = {entry['hash'] for entry in self.current.values()}
+        for directory, _, names in os.walk(self.objects_dir):
+            for name in names:
+                if os.path.basename(directory) + name not in referenced:
+                    os.remove(os.path.join(directory, name))
+
+def iter_snapshot_parts(root_dir, script_name, workers=1, cache=None, delta=False,
+                        max_file_size=DEFAULT_MAX_FILE_SIZE, truncate_at=0, enumeration='walk',
+                        include_untracked=False, dedup=False, excluded=()):
+    # Yields the snapshot one (relative_path, text) part at a time: header, folder lines
+    # and summaries have a relative_path of None, each framed file is one part. Callers
+    # can write each part as soon as it is read. With delta=True only
+    # files added or modified since the cache's manifest are emitted, followed by a
+    # summary that also lists removed files. Binary files and files over max_file_size
+    # are left out and listed with truncated files in a summary at the end. enumeration
+    # and excluded are passed to iter_tree_entries. With dedup=True a file whose content was already
+    # emitted becomes a reference to the first path with that content.
+    log("Listing files with contents")
+    folder_structure = []
+    relative_paths = []
+    max_nesting = 0
+    for kind, path, level in iter_tree_entries(root_dir, script_name, enumeration, include_untracked,
+                                               excluded=excluded):
+        if kind == 'dir':
+            folder_structure.append((path, level))
+            max_nesting = max(max_nesting, level)
+        else:
+            relative_paths.append(path)
+    if delta:
+        yield None, "Changed Files:\n"
+    else:
+        yield None, f"Maximum level of nesting: {max_nesting}\n\nFolder Structure:\n"
+
+        # Add folder structure with indentation for levels
+        for folder, level in folder_structure:
+            indent = '    ' * level
+            folder_name = os.path.basename(folder) if os.path.basename(folder) else folder
+            yield None, f"{indent}- {folder_name}/"
+
+        yield None, "\n\nFiles with Contents:\n"
+    start = time.perf_counter()
+    read_time = 0.0
+    changes = {'added': [], 'modified': []}
+    cached = 0
+    skipped = []
+    truncated = []
+    first_paths = {}
+    duplicates = []
+    for record in read_files_in_order(root_dir, relative_paths, workers, cache, max_file_size, truncate_at):
+        read_time += record.elapsed
+        if record.error is not None:
+            log(f"Error reading file {record.relative_path}: {record.error}")
+        elif record.status == 'skipped':
+            log(f"Skipped file {record.relative_path} ({record.note})")
+            skipped.append(record)
+            continue
+        elif record.status == 'cached':
+            cached += 1
+        else:
+            log(f"Processed file: {record.relative_path}")
+        if record.note is not None:
+            truncated.append(record)
+        if record.status in changes:
+            changes[record.status].append(record.relative_path)
+        if delta and record.status in ('cached', 'unchanged'):
+            continue
+        if dedup and record.error is None:
+            data = record.content.encode('utf-8')
+            original = first_paths.setdefault(hashlib.sha256(data).digest(), record.relative_path)
+            reference = f"[duplicate of {original}]"
+            saved = len(data) - len(reference.encode('utf-8'))
+            # Tiny files (empty __init__.py and the like) are cheaper to repeat than to reference
+            if original != record.relative_path and saved > 0:
+                duplicates.append((record.relative_path, original, saved))
+                yield record.relative_path, record._replace(content=reference).framed()
+                continue
+        yield record.relative_path, record.framed()
+    wall_time = time.perf_counter() - start
+    # Cumulative read time over wall time: how many reads were in flight on average. This
+    # is not a speedup over a sequential run; v_bench.py pipeline measures that.
+    overlap = read_time / wall_time if wall_time > 0 else 1.0
+    for label, records in (('Skipped Files', skipped), ('Truncated Files', truncated)):
+        if records:
+            yield None, f"{label}:\n" + ''.join(f"- {record.relative_path} ({record.note})\n" for record in records)
+    if duplicates:
+        saved_bytes = sum(saved for _, _, saved in duplicates)
+        yield None, "Duplicate Files:\n" + ''.join(f"- {path} (same as {original})\n" for path, original, _ in duplicates) \
+            + f"Saved {saved_bytes} bytes across {len(duplicates)} duplicate files\n"
+        log(f"Deduplicated {len(duplicates)} files, saving {saved_bytes} bytes")
+    log(f"Read {len(relative_paths) - cached} files with {workers} worker(s) in {wall_time:.3f}s "
+        f"(cumulative read time {read_time:.3f}s, {overlap:.2f}x read overlap)")
+    if cache is not None:
+        removed = cache.removed(set(relative_paths))
+        log(f"Reused {cached} cached files: {len(changes['added'])} added, "
+            f"{len(changes['modified'])} modified, {len(removed)} removed")
+        if delta:
+            yield None, "Delta Summary:\n"
+            for label, paths in (('Added', changes['added']), ('Modified', changes['modified']), ('Removed', removed)):
+                yield None, f"{label} files ({len(paths)}):" + ''.join(f"\n- {path}" for path in paths) + "\n"
+        cache.save()
+
+def iter_files_with_contents(root_dir, script_name, workers=1, **options):
+    for _, text in iter_snapshot_parts(root_dir, script_name, workers, **options):
+        yield text
+
+def list_files_with_contents(root_dir, script_name, workers=1):
+    return list(iter_files_with_contents(root_dir, script_name, workers))
+
+class MemoryProfile:
+    # Samples traced Python allocations while a snapshot is written, to show that
+    # memory stays flat instead of growing with the size of the tree.
+    # Only every stride-th part is sampled, and the stride doubles whenever more than
+    # twice the wanted number of points is kept, so the profile itself stays small.
+    def __init__(self, samples=10):
+        self.samples = samples
+        self.stride = 1
+        self.points = []
+        self.last = None
+        tracemalloc.start()
+
+    def sample(self, parts_written, bytes_written):
+        current, _ = tracemalloc.get_traced_memory()
+        self.last = (parts_written, bytes_written, current)
+        if parts_written % self.stride:
+            return
+        self.points.append(self.last)
+        if len(self.points) > 2 * self.samples:
+            self.stride *= 2
+            self.points = [point for point in self.points if point[0] % self.stride == 0]
+
+    def report(self):
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        log("Memory profile (parts written, output MB, traced MB):")
+        step = max(1, len(self.points) // self.samples)
+        points = self.points[::step]
+        if self.last is not None and self.last not in points:
+            points.append(self.last)
+        for parts_written, bytes_written, current in points:
+            log(f"    {parts_written:>10} {bytes_written / 2**20:>10.2f} {current / 2**20:>10.2f}")
+        log(f"Peak traced memory: {peak / 2**20:.2f} MB")
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            log(f"Peak RSS: {max_rss / (2**20 if sys.platform == 'darwin' else 2**10):.2f} MB")
+
+def write_snapshot(parts, out, memory_profile=None):
+    # Writes parts separated by newlines, byte-identical to '\n'.join(parts)
+    bytes_written = 0
+    for index, part in enumerate(parts):
+        if index:
+            out.write('\n')
+        out.write(part)
+        if memory_profile is not None:
+            bytes_written += len(part) + 1
+            memory_profile.sample(index + 1, bytes_written)
+
+def estimate_tokens(text):
+    # Roughly four characters per token for code and English prose; cheap and good enough
+    # to pack shards under a budget
+    return (len(text) + 3) // 4
+
+class ShardWriter:
+    # Packs framed files into numbered shards of at most token_budget estimated tokens.
+    # Files of one directory arrive together and are kept in one shard when they fit;
+    # a directory larger than the budget is split, and a single file larger than the
+    # budget gets a shard of its own. Non-file parts (folder structure and summaries)
+    # go to structure.txt, and index.json maps each path to its shard, byte offset and
+    # length.
+    #
+    # Every shard is written to a temporary file and hashed; it only replaces the shard
+    # of the previous run when the sha256 recorded in that run's index.json differs, so
+    # a rerun after a small change rewrites only the affected shards (and any later
+    # shards the change pushes files into). Shards the new run no longer needs are removed.
+    def __init__(self, shard_dir, token_budget):
+        self.shard_dir = shard_dir
+        self.token_budget = token_budget
+        self.shards = []
+        self.files = {}
+        self.group = []
+        self.group_dir = None
+        self.shard_file = None
+        self.shard_hash = None
+        self.shard_tokens = 0
+        self.shard_bytes = 0
+        self.rewritten = 0
+        os.makedirs(shard_dir, exist_ok=True)
+        self.previous = self.previous_hashes()
+        self.structure_file = open(os.path.join(shard_dir, 'structure.txt.tmp'), 'w', encoding='utf-8', newline='')
+        self.structure_hash = hashlib.sha256()
+        self.structure_parts = 0
+
+    def previous_hashes(self):
+        # {file name: sha256} from the index.json of the previous run, if any
+        try:
+            with open(os.path.join(self.shard_dir, 'index.json'), encoding='utf-8') as f:
+                index = json.load(f)
+            hashes = {shard['file']: shard.get('sha256') for shard in index['shards']}
+            hashes[index['structure']] = index.get('structure_sha256')
+            return hashes
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def add(self, relative_path, text):
+        if relative_path is None:
+            if self.structure_parts:
+                text = '\n' + text
+            self.structure_file.write(text)
+            self.structure_hash.update(text.encode('utf-8'))
+            self.structure_parts += 1
+            return
+        directory = os.path.dirname(relative_path)
+        if directory != self.group_dir:
+            self.flush_group()
+            self.group_dir = directory
+        self.group.append((relative_path, text, estimate_tokens(text)))
+
+    def flush_group(self):
+        group_tokens = sum(tokens for _, _, tokens in self.group)
+        if self.shard_file is not None and self.shard_tokens + group_tokens > self.token_budget \
+                and group_tokens <= self.token_budget:
+            self.close_shard()
+        for relative_path, text, tokens in self.group:
+            if self.shard_file is not None and self.shard_tokens and self.shard_tokens + tokens > self.token_budget:
+                self.close_shard()
+            self.write(relative_path, text, tokens)
+        self.group = []
+
+    def write(self, relative_path, text, tokens):
+        if self.shard_file is None:
+            name = f"snapshot-{len(self.shards) + 1:04d}.txt"
+            self.shards.append({'file': name, 'tokens': 0, 'files': 0})
+            self.shard_file = open(os.path.join(self.shard_dir, name + '.tmp'), 'w', encoding='utf-8', newline='')
+            self.shard_hash = hashlib.sha256()
+        data = text.encode('utf-8')
+        if self.shard_bytes:
+            self.shard_file.write('\n')
+            self.shard_hash.update(b'\n')
+            self.shard_bytes += 1
+        self.files[relative_path] = {'shard': len(self.shards), 'offset': self.shard_bytes, 'length': len(data),
+                                     'tokens': tokens}
+        self.shard_file.write(text)
+        self.shard_hash.update(data)
+        self.shard_bytes += len(data)
+        self.shard_tokens += tokens
+        self.shards[-1]['tokens'] += tokens
+        self.shards[-1]['files'] += 1
+
+    def replace_if_changed(self, name, digest):
+        path = os.path.join(self.shard_dir, name)
+        if self.previous.get(name) == digest and os.path.exists(path):
+            os.remove(path + '.tmp')
+        else:
+            os.replace(path + '.tmp', path)
+            self.rewritten += 1
+
+    def close_shard(self):
+        self.shard_file.close()
+        self.shards[-1]['sha256'] = self.shard_hash.hexdigest()
+        self.replace_if_changed(self.shards[-1]['file'], self.shards[-1]['sha256'])
+        self.shard_file = None
+        self.shard_tokens = 0
+        self.shard_bytes = 0
+
+    def close(self):
+        self.flush_group()
+        if self.shard_file is not None:
+            self.close_shard()
+        self.structure_file.close()
+        structure_sha256 = self.structure_hash.hexdigest()
+        self.replace_if_changed('structure.txt', structure_sha256)
+        current = {shard['file'] for shard in self.shards}
+        for name in self.previous:
+            if name.startswith('snapshot-') and name not in current:
                 try:
-                    with open(os.path.join(root, file), 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                    file_data.append(f"### {relative_path} ###\n{content}\n\n")
-                    print(f"Processed file: {relative_path}")
-                except Exception as e:
-                    file_data.append(f"### {relative_path} ###\nError reading file: {e}\n\n")
-                    print(f"Error reading file {relative_path}: {e}")
-    return file_data
-
-def main():
-    root_dir = "/workspaces/sparc/fun" # You can specify a different directory here
+                    os.remove(os.path.join(self.shard_dir, name))
+                except OSError:
+                    pass
+        index = {'token_budget': self.token_budget, 'structure': 'structure.txt', 'structure_sha256': structure_sha256,
+                 'shards': self.shards, 'files': self.files}
+        temp_path = os.path.join(self.shard_dir, 'index.json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(temp_path, os.path.join(self.shard_dir, 'index.json'))
+
+CONTAINER_MAGIC = b'VSNAP001'
+# Trailer: index offset, index length, magic
+CONTAINER_TRAILER = struct.Struct('<QQ8s')
+
+def get_codec(name='auto'):
+    # Returns (name, compress, decompress); zstd needs the optional zstandard package
+    if name in ('auto', 'zstd') and zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    if name == 'zstd':
+        raise RuntimeError("the zstd codec needs the zstandard package")
+    return 'gzip', lambda data: gzip.compress(data, compresslevel=6), gzip.decompress
+
+class ContainerWriter:
+    # Writes a random-access snapshot: each file is compressed on its own, identical
+    # contents are stored once, and a trailing JSON index maps path -> (offset, length,
+    # sha256, size). The index sits at the end so the container can be streamed out;
+    # the fixed-size trailer tells readers where it starts.
+    def __init__(self, path, codec='auto'):
+        self.path = path
+        self.codec, self.compress, _ = get_codec(codec)
+        self.temp_path = path + '.tmp'
+        self.file = open(self.temp_path, 'wb')
+        self.file.write(CONTAINER_MAGIC)
+        self.offset = len(CONTAINER_MAGIC)
+        self.files = {}
+        self.blobs = {}
+        self.structure = []
+
+    def add(self, relative_path, text):
+        if relative_path is None:
+            self.structure.append(text)
+            return
+        data = unframe(relative_path, text).encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        if content_hash not in self.blobs:
+            self.blobs[content_hash] = self.write_blob(data)
+        offset, length = self.blobs[content_hash]
+        self.files[relative_path] = [offset, length, content_hash, len(data)]
+
+    def write_blob(self, data):
+        compressed = self.compress(data)
+        self.file.write(compressed)
+        offset = self.offset
+        self.offset += len(compressed)
+        return offset, len(compressed)
+
+    def close(self):
+        structure = self.write_blob('\n'.join(self.structure).encode('utf-8'))
+        index = json.dumps({'codec': self.codec, 'structure': structure, 'files': self.files}).encode('utf-8')
+        self.file.write(index)
+        self.file.write(CONTAINER_TRAILER.pack(self.offset, len(index), CONTAINER_MAGIC))
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+class SnapshotReader:
+    # Memory-maps a container written by ContainerWriter and decompresses only the
+    # entries that are asked for:
+    #
+    #     with SnapshotReader('snapshot.vsnap') as snapshot:
+    #         text = snapshot.read('src/app.py')
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{path} is not a snapshot container")
+        if len(self.map) < len(CONTAINER_MAGIC) + CONTAINER_TRAILER.size \
+                or self.map[:len(CONTAINER_MAGIC)] != CONTAINER_MAGIC \
+                or self.map[-len(CONTAINER_MAGIC):] != CONTAINER_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot container")
+        index_offset, index_length, _ = CONTAINER_TRAILER.unpack(self.map[-CONTAINER_TRAILER.size:])
+        index = json.loads(self.map[index_offset:index_offset + index_length])
+        _, _, self.decompress = get_codec(index['codec'])
+        self.files = index['files']
+        self.structure_entry = index['structure']
+
+    def paths(self):
+        return list(self.files)
+
+    def __contains__(self, relative_path):
+        return relative_path in self.files
+
+    def read_blob(self, offset, length):
+        return self.decompress(self.map[offset:offset + length]).decode('utf-8')
+
+    def read(self, relative_path):
+        offset, length, _, _ = self.files[relative_path]
+        return self.read_blob(offset, length)
+
+    def structure(self):
+        # Folder structure and summaries, as in the text snapshot
+        return self.read_blob(*self.structure_entry)
+
+    def close(self):
+        if getattr(self, 'map', None) is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# inotify(7) constants
+IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_DELETE_SELF, IN_MOVE_SELF = 0x400, 0x800
+INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                | IN_DELETE_SELF | IN_MOVE_SELF)
+
+class InotifyWaker:
+    # Wakes the watch loop as soon as something changes in a watched directory. Uses
+    # Linux inotify through ctypes; create() returns None where it is not available or
+    # the watch limit is reached, and the loop then falls back to polling.
+    @classmethod
+    def create(cls):
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+
+    def watch(self, directories):
+        for directory in directories:
+            if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK) < 0:
+                log(f"inotify watch failed for {directory} ({os.strerror(ctypes.get_errno())}), polling instead")
+                return False
+        return True
+
+    def wait(self, timeout):
+        # True if events arrived within timeout seconds; drains them either way
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+def stat_manifest(root_dir, script_name, enumeration='walk', include_untracked=False, excluded=()):
+    # (kind, size, mtime_ns) of every file the snapshot would include and (kind, None, None)
+    # of every directory; two equal manifests mean the snapshot is still current. Files added
+    # or removed show up as entries, so directory mtimes would only add noise from excluded
+    # files, like the snapshot being written into the tree.
+    manifest = {}
+    for kind, path, _ in iter_tree_entries(root_dir, script_name, enumeration, include_untracked, verbose=False,
+                                           excluded=excluded):
+        if kind == 'dir':
+            manifest[path] = (kind, None, None)
+            continue
+        full_path = os.path.join(root_dir, path)
+        try:
+            stat = os.stat(full_path)
+            manifest[full_path] = (kind, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            manifest[full_path] = (kind, None, None)
+    return manifest
+
+def write_watch_status(status_path, status):
+    temp_path = status_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, indent=2)
+    os.replace(temp_path, status_path)
+
+def watch_snapshot(root_dir, script_name, write, status_path, interval=2.0, debounce=0.5, enumeration='walk',
+                   include_untracked=False, excluded=()):
+    # Keeps a snapshot current: write() regenerates it (reusing the cache for unchanged
+    # files), then the tree's stat manifest is compared after every inotify event, or on
+    # every poll when inotify is not available. A burst of changes is debounced until the
+    # tree has been quiet for `debounce` seconds. status_path records when the snapshot
+    # was written and since when it has been stale, so consumers can tell how far behind
+    # it is.
+    #
+    # How much of the output a refresh rewrites depends on its format: sharded output
+    # only replaces the shards whose content changed (see ShardWriter). A text snapshot
+    # or a container is one file whose offsets shift with any change, so it is written
+    # again as a whole, from the cache for everything but the changed files.
+    #
+    # excluded lists what write() itself creates or changes (the output, its temporary
+    # file, the cache). Inside the tree, those would look like a change after every
+    # refresh and trigger the next one; the status file is left out here.
+    excluded = (*excluded, status_path, status_path + '.tmp')
+
+    def scan():
+        return stat_manifest(root_dir, script_name, enumeration, include_untracked, excluded)
+
+    def quiet_manifest(current):
+        if waker is not None:
+            while waker.wait(debounce):
+                pass
+            return scan()
+        while True:
+            time.sleep(debounce)
+            settled = scan()
+            if settled == current:
+                return settled
+            current = settled
+
+    def snapshot(manifest):
+        if waker is not None and not waker.watch(path for path, (kind, _, _) in manifest.items() if kind == 'dir'):
+            stop_waker()
+        start = time.time()
+        write()
+        status = {'root': root_dir, 'backend': 'inotify' if waker is not None else 'polling',
+                  'written_at': time.time(), 'build_seconds': round(time.time() - start, 3),
+                  'stale_since': None, 'entries': len(manifest)}
+        write_watch_status(status_path, status)
+        return status
+
+    def stop_waker():
+        nonlocal waker
+        waker.close()
+        waker = None
+
+    if enumeration == 'auto':
+        enumeration = 'git' if list_git_files(root_dir, include_untracked) else 'walk'
+    waker = InotifyWaker.create()
+    manifest = scan()
+    status = snapshot(manifest)
+    log(f"Watching {root_dir} ({status['backend']}); status in {status_path}")
+    try:
+        while True:
+            if waker is not None:
+                # Nothing changed in a watched directory: no need to look at the tree
+                if not waker.wait(interval):
+                    continue
+            else:
+                time.sleep(interval)
+            current = scan()
+            if current == manifest:
+                continue
+            status['stale_since'] = time.time()
+            write_watch_status(status_path, status)
+            manifest = quiet_manifest(current)
+            stale_for = time.time() - status['stale_since']
+            status = snapshot(manifest)
+            log(f"Snapshot refreshed after changes, {stale_for:.1f}s stale")
+    except KeyboardInterrupt:
+        log("Stopped watching")
+    finally:
+        if waker is not None:
+            waker.close()
+
+def log(message):
+    # Progress goes to stderr so the snapshot itself can be streamed to stdout
+    print(message, file=sys.stderr)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write a folder structure and file contents snapshot.")
+    parser.add_argument("root_dir", nargs="?", default=DEFAULT_ROOT_DIR,
+                        help=f"directory to snapshot (default: {DEFAULT_ROOT_DIR})")
+    parser.add_argument("-o", "--output", default="output.txt",
+                        help="file to write the snapshot to, '-' for stdout (default: output.txt)")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of threads reading files in parallel, for trees on network volumes; "
+                             f"1 reads sequentially, which is faster on local disks (default: {DEFAULT_WORKERS}, "
+                             f"{PARALLEL_WORKERS} is a good start for a network volume)")
+    parser.add_argument("--enumerate", choices=("auto", "walk", "git"), default="auto",
+                        help="list files from the git index ('git'), by scanning the file system ('walk'), "
+                             "or from the index when the root is in a git work tree ('auto', the default). "
+                             "The index leaves out files that were never `git add`ed; see --untracked")
+    parser.add_argument("--untracked", action="store_true",
+                        help="with the git index, also include untracked files that are not ignored")
+    parser.add_argument("--max-file-size", type=int, default=DEFAULT_MAX_FILE_SIZE,
+                        help=f"skip files larger than this many bytes, 0 for no limit (default: {DEFAULT_MAX_FILE_SIZE})")
+    parser.add_argument("--truncate-at", type=int, default=0,
+                        help="keep only this many bytes of longer files and mark them truncated, 0 to keep whole files")
+    parser.add_argument("--dedup", action="store_true",
+                        help="replace files whose content was already written with a reference to the first copy "
+                             "(not with --container, which stores identical contents once)")
+    parser.add_argument("--cache-dir",
+                        help="keep a manifest and content cache here so reruns only read changed files")
+    parser.add_argument("--delta", action="store_true",
+                        help="only write files added or modified since the last run with --cache-dir, plus removed paths")
+    parser.add_argument("--shard-tokens", type=int, default=0,
+                        help="split files into shards of at most this many estimated tokens, with an index.json")
+    parser.add_argument("--shard-dir", default="snapshot_shards",
+                        help="directory for --shard-tokens output (default: snapshot_shards)")
+    parser.add_argument("--container",
+                        help="write a compressed, indexed snapshot container to this path instead of text")
+    parser.add_argument("--codec", choices=("auto", "zstd", "gzip"), default="auto",
+                        help="compression for --container; auto uses zstd when zstandard is installed, else gzip")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and refresh the snapshot whenever the tree changes")
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="seconds between checks for changes in --watch mode (default: 2.0)")
+    parser.add_argument("--debounce", type=float, default=0.5,
+                        help="seconds the tree must be quiet before a refresh in --watch mode (default: 0.5)")
+    parser.add_argument("--memory-profile", action="store_true",
+                        help="trace allocations while writing and report the memory profile")
+    args = parser.parse_args(argv)
+    if args.delta and not args.cache_dir:
+        parser.error("--delta requires --cache-dir")
+    if args.dedup and args.container:
+        parser.error("--dedup cannot be used with --container, which already stores identical files once")
+    if args.watch and args.output == '-' and not (args.shard_tokens > 0 or args.container):
+        parser.error("--watch needs an output file, not stdout")
+    return args
+
+def write_output(args, parts, memory_profile=None):
+    if args.shard_tokens > 0:
+        shard_writer = ShardWriter(args.shard_dir, args.shard_tokens)
+        for relative_path, text in parts:
+            shard_writer.add(relative_path, text)
+        shard_writer.close()
+        log(f"Wrote {len(shard_writer.shards)} shards and index.json to {args.shard_dir} "
+            f"(rewrote {shard_writer.rewritten} changed files).")
+    elif args.container:
+        container_writer = ContainerWriter(args.container, args.codec)
+        for relative_path, text in parts:
+            container_writer.add(relative_path, text)
+        container_writer.close()
+        log(f"Wrote {len(container_writer.files)} files ({container_writer.codec}) to {args.container}.")
+    elif args.output == '-':
+        write_snapshot((text for _, text in parts), sys.stdout, memory_profile)
+        sys.stdout.flush()
+    else:
+        # Written next to the target and renamed, so readers never see a partial snapshot
+        temp_path = args.output + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            write_snapshot((text for _, text in parts), f, memory_profile)
+        os.replace(temp_path, args.output)
+        log(f"File list with contents has been written to {args.output}.")
+
+def main(argv=None):
+    args = parse_args(argv)
+    root_dir = args.root_dir
     script_name = os.path.basename(__file__)
-    print(f"Script name: {script_name}")
-    files_with_contents = list_files_with_contents(root_dir, script_name)
-    result = '\n'.join(files_with_contents)
-    output_file = 'output.txt'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(result)
-    print(f"File list with contents has been written to {output_file}.")
+    log(f"Script name: {script_name}")
+    memory_profile = MemoryProfile() if args.memory_profile else None
+    options = {'max_file_size': args.max_file_size, 'truncate_at': args.truncate_at}
+    cache_dir = args.cache_dir
+    if args.watch and not cache_dir:
+        cache_dir = tempfile.mkdtemp(prefix='v_watch_')
+
+    # What this run writes is never part of the snapshot, even when it lands inside the tree
+    target = args.shard_dir if args.shard_tokens > 0 else args.container or args.output
+    status_path = target.rstrip(os.sep) + '.status.json'
+    excluded = [path for path in (target, target + '.tmp', cache_dir) if path and path != '-']
+    if args.watch:
+        excluded += [status_path, status_path + '.tmp']
+
+    def write():
+        cache = SnapshotCache(cache_dir, options) if cache_dir else None
+        parts = iter_snapshot_parts(root_dir, script_name, max(1, args.workers), cache, args.delta,
+                                    args.max_file_size, args.truncate_at, args.enumerate, args.untracked,
+                                    args.dedup, excluded)
+        write_output(args, parts, memory_profile)
+
+    try:
+        if args.watch:
+            watch_snapshot(root_dir, script_name, write, status_path, args.interval,
+                           args.debounce, args.enumerate, args.untracked, excluded)
+        else:
+            write()
+    except RuntimeError as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        if cache_dir and not args.cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    if memory_profile is not None:
+        memory_profile.report()
 
 if __name__ == "__main__":
     main()
-
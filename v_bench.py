@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import v
+
+def make_git_tree(root_dir, file_count, files_per_dir=50, dirs_per_dir=8):
+    # Creates file_count small files spread over a balanced directory tree, a .gitignore
+    # with a handful of rules, and a git index listing every file.
+    print(f"Generating {file_count} files in {root_dir}")
+    os.makedirs(root_dir, exist_ok=True)
+    with open(os.path.join(root_dir, '.gitignore'), 'w') as f:
+        f.write("*.log\nbuild/\n/dist\n**/node_modules\n!keep.log\n")
+    directories = [root_dir]
+    created = 0
+    index = 0
+    while created < file_count:
+        directory = directories[index]
+        index += 1
+        for i in range(min(files_per_dir, file_count - created)):
+            with open(os.path.join(directory, f"file_{i}.py"), 'w') as f:
+                f.write(f"# file {created}\nprint({created})\n")
+            created += 1
+        for i in range(dirs_per_dir):
+            subdirectory = os.path.join(directory, f"dir_{i}")
+            os.makedirs(subdirectory, exist_ok=True)
+            directories.append(subdirectory)
+    subprocess.run(['git', 'init', '-q'], cwd=root_dir, check=True)
+    subprocess.run(['git', 'add', '-A'], cwd=root_dir, check=True)
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def walk_files(root_dir):
+    ignore_rules = (('', v.IgnoreRules(v.read_gitignore(root_dir, verbose=False))),)
+    return [path for kind, path, _ in v.scan_tree(root_dir, ignore_rules, 'v.py') if kind == 'file']
+
+def git_files(root_dir):
+    return [path for kind, path, _ in v.scan_git_index(root_dir, v.list_git_files(root_dir), 'v.py') if kind == 'file']
+
+def bench_enumeration(args):
+    root_dir = args.root or tempfile.mkdtemp(prefix='v_bench_')
+    try:
+        if not args.root:
+            make_git_tree(root_dir, args.files)
+        walk_time, walked = best_of(args.repeat, lambda: walk_files(root_dir))
+        git_time, listed = best_of(args.repeat, lambda: git_files(root_dir))
+        print(f"{'backend':<8} {'files':>8} {'seconds':>9} {'files/sec':>12}")
+        for name, seconds, paths in (('walk', walk_time, walked), ('git', git_time, listed)):
+            print(f"{name:<8} {len(paths):>8} {seconds:>9.3f} {len(paths) / seconds:>12.0f}")
+        print(f"git index enumeration: {walk_time / git_time:.2f}x the walker's speed")
+        if set(walked) != set(listed):
+            print(f"Warning: backends disagree on {len(set(walked) ^ set(listed))} paths")
+    finally:
+        if not args.root and not args.keep:
+            shutil.rmtree(root_dir)
+
+def write_files(directory, count, size, prefix='file'):
+    os.makedirs(directory, exist_ok=True)
+    line = "x = 'synthetic benchmark content'\n"
+    content = (line * (size // len(line) + 1))[:size]
+    for i in range(count):
+        with open(os.path.join(directory, f"{prefix}_{i}.py"), 'w') as f:
+            f.write(content)
+
+def make_small_files(root_dir, scale):
+    # Many small files in wide directories
+    for d in range(200 * scale):
+        write_files(os.path.join(root_dir, f"pkg_{d // 20}", f"mod_{d}"), 100, 1024)
+
+def make_huge_files(root_dir, scale):
+    # A few very large files
+    write_files(root_dir, 4 * scale, 64 * 2**20, prefix='blob')
+
+def make_deep_nesting(root_dir, scale):
+    # Long directory chains, a few files per level
+    for chain in range(10 * scale):
+        directory = os.path.join(root_dir, f"chain_{chain}")
+        for depth in range(100):
+            directory = os.path.join(directory, f"level_{depth}")
+            write_files(directory, 5, 2048)
+
+def make_heavy_ignore(root_dir, scale):
+    # Hundreds of ignore rules at the root plus nested .gitignore files
+    os.makedirs(root_dir, exist_ok=True)
+    rules = []
+    for i in range(400):
+        rules += [f"*.tmp{i}", f"build_{i}/", f"/generated_{i}/**", f"**/cache_{i}/*.py", f"!keep_{i}.tmp{i}"]
+    with open(os.path.join(root_dir, '.gitignore'), 'w') as f:
+        f.write('\n'.join(rules) + '\n')
+    for d in range(50 * scale):
+        directory = os.path.join(root_dir, f"src_{d}")
+        write_files(directory, 100, 1024)
+        write_files(os.path.join(directory, f"build_{d}"), 10, 1024)
+        with open(os.path.join(directory, '.gitignore'), 'w') as f:
+            f.write(f"file_{d % 100}.py\n!file_{(d + 1) % 100}.py\n")
+
+SHAPES = {
+    'small-files': make_small_files,
+    'huge-files': make_huge_files,
+    'deep-nesting': make_deep_nesting,
+    'heavy-ignore': make_heavy_ignore,
+}
+
+class TimedWriter:
+    # File wrapper that accumulates the time spent inside write()
+    def __init__(self, out):
+        self.out = out
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def write(self, text):
+        start = time.perf_counter()
+        self.out.write(text)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(text)
+
+def peak_rss_mb():
+    if v.resource is None:
+        return float('nan')
+    max_rss = v.resource.getrusage(v.resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+def profile_pipeline(root_dir, workers):
+    # Times each phase of a snapshot of root_dir; returns (phase, seconds, files, bytes) rows
+    rows = []
+    start = time.perf_counter()
+    ignore_rules = (('', v.IgnoreRules(v.read_gitignore(root_dir, verbose=False))),)
+    rows.append(('read_gitignore', time.perf_counter() - start, 0, 0))
+
+    start = time.perf_counter()
+    paths = [path for kind, path, _ in v.scan_tree(root_dir, ignore_rules, 'v.py') if kind == 'file']
+    rows.append(('folder walk', time.perf_counter() - start, len(paths), 0))
+
+    # The sequential baseline first, so the parallel pass does not get its page cache for free
+    phases = [('reads, 1 thread', 1)] if workers > 1 else []
+    for phase, threads in phases + [('content reads', workers)]:
+        start = time.perf_counter()
+        read_bytes = 0
+        for record in v.read_files_in_order(root_dir, paths, threads, max_file_size=0):
+            read_bytes += len(record.content or '')
+        rows.append((phase, time.perf_counter() - start, len(paths), read_bytes))
+
+    with tempfile.TemporaryFile('w', encoding='utf-8') as f:
+        writer = TimedWriter(f)
+        start = time.perf_counter()
+        v.write_snapshot(v.iter_files_with_contents(root_dir, 'v.py', workers, max_file_size=0), writer)
+        total = time.perf_counter() - start
+    rows.append(('output write', writer.seconds, len(paths), writer.bytes))
+    rows.append(('end to end', total, len(paths), writer.bytes))
+    return rows
+
+def bench_pipeline(args):
+    if args.shape == 'all' and not args.root:
+        # One process per shape so each reports its own peak RSS
+        for shape in SHAPES:
+            command = [sys.executable, os.path.abspath(__file__), 'pipeline', '--shape', shape,
+                       '--scale', str(args.scale), '--workers', str(args.workers)]
+            subprocess.run(command + (['--keep'] if args.keep else []), check=True)
+        return
+    root_dir = args.root or tempfile.mkdtemp(prefix=f"v_bench_{args.shape}_")
+    try:
+        if not args.root:
+            start = time.perf_counter()
+            SHAPES[args.shape](root_dir, args.scale)
+            print(f"Generated {args.shape} tree in {root_dir} ({time.perf_counter() - start:.1f}s)")
+        rows = profile_pipeline(root_dir, args.workers)
+        print(f"{'phase':<16} {'seconds':>9} {'files/sec':>12} {'MB/sec':>9}")
+        for phase, seconds, files, size in rows:
+            files_per_sec = f"{files / seconds:.0f}" if files and seconds else '-'
+            mb_per_sec = f"{size / 2**20 / seconds:.1f}" if size and seconds else '-'
+            print(f"{phase:<16} {seconds:>9.3f} {files_per_sec:>12} {mb_per_sec:>9}")
+        seconds = {phase: seconds for phase, seconds, _, _ in rows}
+        if 'reads, 1 thread' in seconds and seconds['content reads']:
+            print(f"Reads with {args.workers} threads: {seconds['reads, 1 thread'] / seconds['content reads']:.2f}x the sequential speed")
+        print(f"Peak RSS: {peak_rss_mb():.1f} MB\n")
+    finally:
+        if not args.root and not args.keep:
+            shutil.rmtree(root_dir)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the v.py snapshot pipeline.")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    pipeline = subparsers.add_parser('pipeline', help="time each phase of a snapshot on a synthetic tree")
+    pipeline.add_argument('--shape', choices=['all'] + list(SHAPES), default='all',
+                          help="kind of tree to generate (default: all, each in its own process)")
+    pipeline.add_argument('--scale', type=int, default=1, help="multiplies the size of the generated tree (default: 1)")
+    pipeline.add_argument('--root', help="profile an existing tree instead of generating one")
+    pipeline.add_argument('-j', '--workers', type=int, default=v.PARALLEL_WORKERS,
+                          help=f"reader threads, compared against one (default: {v.PARALLEL_WORKERS})")
+    pipeline.add_argument('--keep', action='store_true', help="keep the generated tree")
+    pipeline.set_defaults(run=bench_pipeline)
+    enumeration = subparsers.add_parser('enumeration', help="compare the file system walker with the git index")
+    enumeration.add_argument('--files', type=int, default=100000, help="files in the generated repository (default: 100000)")
+    enumeration.add_argument('--root', help="benchmark an existing git work tree instead of generating one")
+    enumeration.add_argument('--repeat', type=int, default=3, help="runs per backend, the best is reported (default: 3)")
+    enumeration.add_argument('--keep', action='store_true', help="keep the generated tree")
+    enumeration.set_defaults(run=bench_enumeration)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Silence v.py's progress messages; they would drown the benchmark tables
+    v.log = lambda message: None
+    args.run(args)
+
+if __name__ == "__main__":
+    main()